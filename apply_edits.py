@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+
+"""Replace AFF links on wiki pages with their data.census.gov equivalents.
+
+Reads the "title<TAB>url" lines written by get_links.py --incremental,
+converts each URL with transform.py, and makes one edit per page
+covering all of its links.  Edits run on several threads, but a shared
+Throttle spaces them out; mwclient itself sends maxlag with every
+request and waits when the servers are lagged.  The outcome for every
+(page, url) pair is logged to a progress file, so an interrupted run
+can be restarted with the same arguments and will pick up where it left
+off, and a later harvest only redoes links that haven't been dealt with.
+
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import mwclient
+
+import get_links
+import transform
+from link_stats import read_links
+
+SUMMARY = ('Replacing links to the retired American FactFinder with data.census.gov, '
+           'see [[Wikipedia:US Census Migration]]')
+
+# How long to back off, in seconds, when the API says we're editing too fast
+RATELIMIT_BACKOFF = 60
+MAX_ATTEMPTS = 3
+
+# Statuses that mean a link is done with.  Anything else (rate limited
+# too many times, API or network errors, rejected edits, links that
+# couldn't be found in the wikitext) is retried on the next run.
+FINAL_STATUSES = {'saved', 'missing', 'protected', 'unconvertible'}
+
+# What may come before and after an external link in wikitext: the start
+# or end of the text, whitespace, brackets, template and tag delimiters.
+# MediaWiki leaves trailing punctuation off bare links.  Requiring these
+# means an AFF url inside another url (e.g. an archive-url) is left alone.
+URL_START = r'(?<![^\s\[=|>])'
+URL_END = r'(?=[.,;:!?]*(?:[\s\]|}<]|$))'
+
+
+class Throttle:
+    """Spaces out calls to wait() so they are at least `interval` seconds
+    apart, across all threads.
+
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, seconds):
+        """Hold off everybody for at least another `seconds` seconds."""
+        with self.lock:
+            self.next_time = max(self.next_time, time.monotonic() + seconds)
+
+
+class Progress:
+    """Append-only record of what happened to the links on each page,
+    one JSON object per line.  Every attempt is logged, but only
+    (title, url) pairs with one of FINAL_STATUSES count as done.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path.exists():
+            with path.open() as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry['status'] in FINAL_STATUSES:
+                            title = entry['title']
+                            self.done.update((title, url) for url in entry['urls'])
+        self.file = path.open('a')
+
+    def record(self, title, status, urls):
+        urls = sorted(urls)
+        with self.lock:
+            if status in FINAL_STATUSES:
+                self.done.update((title, url) for url in urls)
+            print(json.dumps({'title': title, 'status': status, 'urls': urls}),
+                  file=self.file, flush=True)
+
+    def close(self):
+        self.file.close()
+
+
+def group_by_page(lines):
+    """Read get_links.py output into an OrderedDict mapping each page
+    title to the list of AFF urls on it.
+
+    """
+    pages = collections.OrderedDict()
+    for title, url, _ in read_links(lines):
+        urls = pages.setdefault(title, [])
+        if url not in urls:
+            urls.append(url)
+    return pages
+
+
+def convert(urls):
+    """Return an OrderedDict mapping each url that transform.py can
+    convert cleanly to its replacement.  Anything that fails, or only
+    converts with a warning, is left alone.
+
+    """
+    conversions = collections.OrderedDict()
+    for url in urls:
+        if transform.triage(url):
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                conversions[url] = transform.main(url)
+            except Exception:
+                pass
+    return conversions
+
+
+def replace_links(text, conversions):
+    """Replace each complete occurrence of an old url with its new one.
+    A url only matches where a link can start and end in the wikitext (see
+    URL_START and URL_END), so an AFF url is never replaced inside a longer
+    one.  Returns the new text and the set of old urls that were found.
+
+    """
+    if not conversions:
+        return text, set()
+    olds = sorted(conversions, key=len, reverse=True)
+    alternatives = '|'.join(map(re.escape, olds))
+    pattern = re.compile('%s(?:%s)%s' % (URL_START, alternatives, URL_END))
+    found = set()
+
+    def substitute(match):
+        found.add(match.group(0))
+        return conversions[match.group(0)]
+
+    return pattern.sub(substitute, text), found
+
+
+def edit_failure(error):
+    """Return a short reason if an EditError is a rejected edit (abuse
+    filter, spam blacklist, captcha, ...), or None if it's an edit
+    conflict.  mwclient raises EditError(page, summary, info) for
+    conflicts and EditError(page, result) for a 'Failure' result.
+
+    """
+    result = error.args[-1]
+    if not isinstance(result, dict):
+        return None
+    for key in ('code', 'spamblacklist', 'captcha'):
+        if key in result:
+            return result[key] if key == 'code' else key
+    return 'unknown'
+
+
+def apply_page(site, title, conversions, throttle, summary=SUMMARY):
+    """Make a single edit to the page replacing all its converted links.
+    Returns a short status string for the progress file, and the set of
+    old urls that were found in the page.
+
+    """
+    found = set()
+    for attempt in range(MAX_ATTEMPTS):
+        page = site.pages[title]
+        if not page.exists:
+            return 'missing', found
+        new_text, found = replace_links(page.text(), conversions)
+        if not found:
+            return 'unmatched', found
+
+        throttle.wait()
+        try:
+            page.save(new_text, summary=summary)
+            return 'saved', found
+        except mwclient.errors.ProtectedPageError:
+            return 'protected', found
+        except mwclient.errors.EditError as e:
+            reason = edit_failure(e)
+            if reason:
+                return 'failed: %s' % reason, found
+            # Edit conflict; re-read the page and try again
+        except mwclient.errors.APIError as e:
+            if e.code != 'ratelimited':
+                return 'error: %s' % e.code, found
+            throttle.backoff(RATELIMIT_BACKOFF)
+    return 'gave up', found
+
+
+def apply_all(site, pages, progress, throttle, workers=4, summary=SUMMARY):
+    """Apply the edits for every (page, url) not already done according
+    to the progress file.  Returns a Counter of the resulting page
+    statuses.
+
+    The urls are converted here on the calling thread, because convert()
+    changes the process-wide warnings filters; the worker threads only
+    read, replace and save.
+
+    """
+    def work(title, conversions):
+        try:
+            status, found = apply_page(site, title, conversions, throttle, summary)
+        except Exception as e:
+            # Network trouble, not logged in, ...: log it and move on
+            status, found = 'error: %s' % type(e).__name__, set()
+        if status == 'saved':
+            progress.record(title, status, found)
+            unmatched = set(conversions) - found
+            if unmatched:
+                progress.record(title, 'unmatched', unmatched)
+        else:
+            progress.record(title, status, conversions)
+        return status
+
+    statuses = collections.Counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = []
+        for title, urls in pages.items():
+            urls = [url for url in urls if (title, url) not in progress.done]
+            if not urls:
+                continue
+            conversions = convert(urls)
+            unconvertible = set(urls) - set(conversions)
+            if unconvertible:
+                progress.record(title, 'unconvertible', unconvertible)
+            if conversions:
+                futures.append(executor.submit(work, title, conversions))
+            else:
+                statuses['unconvertible'] += 1
+        for future in concurrent.futures.as_completed(futures):
+            statuses[future.result()] += 1
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile',
+                        nargs='*',
+                        type=argparse.FileType('r'),
+                        default=[sys.stdin],
+                        help='Output of get_links.py --incremental')
+    parser.add_argument('--progress',
+                        type=Path,
+                        default=Path('apply_edits_progress.jsonl'),
+                        help='File recording what was done to each link, used to resume')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=4,
+                        help='Number of pages to work on at once')
+    parser.add_argument('--interval',
+                        type=float,
+                        default=10,
+                        help='Minimum number of seconds between edits')
+    parser.add_argument('--summary',
+                        default=SUMMARY,
+                        help='Edit summary')
+    parser.add_argument('--user',
+                        required=True,
+                        help='Bot account to log in as; the password is taken '
+                        'from $FACTFINDER_BOT_PASSWORD')
+    parser.add_argument('--site',
+                        default=get_links.SITE,
+                        help='Wiki to edit')
+    parser.add_argument('--scheme',
+                        default='https')
+    parser.add_argument('--path',
+                        default='/w/',
+                        help='Script path on the wiki, i.e. where api.php lives')
+    args = parser.parse_args()
+
+    site = get_links.connect(args.site, scheme=args.scheme, path=args.path,
+                             force_login=True)
+    site.login(args.user, os.environ['FACTFINDER_BOT_PASSWORD'])
+
+    pages = group_by_page(line for f in args.infile for line in f)
+    progress = Progress(args.progress)
+    try:
+        statuses = apply_all(site, pages, progress, Throttle(args.interval),
+                             args.workers, args.summary)
+    finally:
+        progress.close()
+    for status, count in statuses.most_common():
+        print(status, count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+"""Disk-backed deduplication of harvested AFF links
+
+Reads the output of find_links_multi_db.py or get_links.py and writes
+each distinct URL once, along with the total number of linking pages and
+the number of distinct wikis or pages it was seen on.  At most
+max_entries (url, source) pairs are held in memory; beyond that, sorted
+runs are spilled to temporary files and merged at the end.
+"""
+
+import sys
+import heapq
+import argparse
+import tempfile
+from itertools import groupby
+
+from link_stats import read_links
+
+
+def write_run(rows, tmpdir):
+    """Writes (url, source, pages) rows, already sorted by (url, source),
+    to a temporary file
+    """
+    run = tempfile.TemporaryFile("w+", encoding="utf-8", dir=tmpdir)
+    for url, source, pages in rows:
+        print(url, source, pages, sep="\t", file=run)
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    for line in run:
+        url, source, pages = line.rstrip("\n").split("\t")
+        yield url, source, int(pages)
+
+
+def sorted_entries(entries):
+    return ((url, source, pages) for (url, source), pages in sorted(entries.items()))
+
+
+def merge_runs(row_iters):
+    """Merges sorted row iterators, keeping one row per (url, source)"""
+    merged = heapq.merge(*row_iters)
+    for (url, source), rows in groupby(merged, key=lambda row: row[:2]):
+        yield url, source, max(pages for _, _, pages in rows)
+
+
+def dedup(links, max_entries=1000000, tmpdir=None, fan_in=64):
+    """Yields (url, pages, sources) for each distinct URL, sorted by URL
+
+    links is an iterable of (source, url, pages) tuples as produced by
+    link_stats.read_links().  Seeing the same (source, url) more than
+    once counts it once.
+
+    Whenever fan_in runs of the same size accumulate, they are merged into
+    one larger run, so fewer than fan_in spill files per size are ever
+    open at once.  fan_in must be at least 2.
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+    return _dedup(links, max_entries, tmpdir, fan_in)
+
+
+def _dedup(links, max_entries, tmpdir, fan_in):
+    # levels[i] holds the runs made by merging fan_in runs from levels[i - 1]
+    levels = [[]]
+    entries = {}
+
+    def add_run(run, level=0):
+        while True:
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(run)
+            if len(levels[level]) < fan_in:
+                return
+            runs, levels[level] = levels[level], []
+            try:
+                run = write_run(merge_runs(read_run(r) for r in runs), tmpdir)
+            finally:
+                for r in runs:
+                    r.close()
+            level += 1
+
+    try:
+        for source, url, pages in links:
+            key = (url, source)
+            entries[key] = max(pages, entries.get(key, 0))
+            if len(entries) >= max_entries:
+                add_run(write_run(sorted_entries(entries), tmpdir))
+                entries = {}
+
+        runs = [run for level in levels for run in level]
+        merged = merge_runs(
+            [read_run(run) for run in runs] + [sorted_entries(entries)]
+        )
+        for url, rows in groupby(merged, key=lambda row: row[0]):
+            total = sources = 0
+            for _, _, pages in rows:
+                total += pages
+                sources += 1
+            yield url, total, sources
+    finally:
+        for level in levels:
+            for run in level:
+                run.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write each distinct AFF URL once, with the number of "
+        "pages and sources linking to it",
+        epilog="Output lines are url<TAB>pages<TAB>sources, sorted by URL.",
+        prog="dedup_links.py",
+    )
+    parser.add_argument(
+        "infile",
+        nargs="*",
+        type=argparse.FileType("r"),
+        default=[sys.stdin],
+        help="Output of find_links_multi_db.py or get_links.py --incremental",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="File to write the distinct URLs to",
+    )
+    parser.add_argument(
+        "-m",
+        "--max-entries",
+        type=int,
+        default=1000000,
+        help="Number of (url, source) pairs to hold in memory before "
+        "spilling to disk",
+    )
+    parser.add_argument(
+        "--fan-in",
+        type=int,
+        default=64,
+        help="Number of spill files to merge at once (at least 2)",
+    )
+    parser.add_argument(
+        "--tmpdir", help="Directory for spill files (default: system temp dir)"
+    )
+    parser.add_argument(
+        "--urls-only",
+        action="store_true",
+        help="Only write the URLs, one per line, for feeding to transform.py",
+    )
+    args = parser.parse_args()
+    if args.fan_in < 2:
+        parser.error("--fan-in must be at least 2")
+
+    links = (link for f in args.infile for link in read_links(f))
+    unique = dedup(links, args.max_entries, args.tmpdir, args.fan_in)
+    for url, pages, sources in unique:
+        if args.urls_only:
+            print(url, file=args.outfile)
+        else:
+            print(url, pages, sources, sep="\t", file=args.outfile)
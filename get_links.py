@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import argparse
+import datetime
+import json
 import re
 import urllib.parse
 from pathlib import Path
@@ -9,19 +11,179 @@ import mwclient
 
 SITE = 'en.wikipedia.org'
 USER_AGENT = 'User:RoySmith, factfinder'
+AFF_DOMAIN = 'factfinder.census.gov'
+
+# MediaWiki only keeps $wgRCMaxAge worth of recent changes (30 days on
+# the WMF wikis).  If the high-water mark is older than that, the
+# recentchanges feed has holes in it and we have to do a full rescan.
+RC_MAX_AGE = datetime.timedelta(days=30)
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only look at pages edited or created since the last run')
+    parser.add_argument('--state',
+                        type=Path,
+                        default=Path('get_links_state.json'),
+                        help='File holding the high-water timestamp for --incremental')
+    parser.add_argument('--feed',
+                        type=Path,
+                        help='Read changed pages from this file (one JSON object with '
+                        '"title" and "timestamp" per line) instead of recentchanges')
     args = parser.parse_args()
 
-    site = mwclient.Site(SITE, clients_useragent=USER_AGENT)
+    site = connect()
     ns_by_number = site.namespaces
     ns_by_name = {v: k for k, v in site.namespaces.items()}
 
-    pages = site.exturlusage('factfinder.census.gov')
-    for page in pages:
-        print(page['title'])
-    
+    if not args.incremental:
+        pages = site.exturlusage(AFF_DOMAIN)
+        for page in pages:
+            print(page['title'])
+        return
+
+    for title, url in incremental(site, args.state, args.feed):
+        print('%s\t%s' % (title, url))
+
+
+def incremental(site, state, feed=None, now=None):
+    """Yield (title, url) for the AFF links on pages changed since the
+    high-water mark in the state file, then move the mark forward.  Does
+    a full scan if there's no usable mark.
+
+    """
+    run_start = now or datetime.datetime.utcnow()
+    high_water = load_high_water(state)
+    if needs_full_scan(high_water, run_start):
+        yield from full_scan(site)
+        save_high_water(state, run_start)
+        return
+
+    if feed:
+        changes = feed_changes(feed, high_water)
+    else:
+        changes = recent_changes(site, high_water)
+
+    seen = set()
+    newest = high_water
+    for title, timestamp in changes:
+        newest = max(newest, timestamp)
+        if title in seen:
+            continue
+        seen.add(title)
+        for url in aff_links(site.pages[title]):
+            yield title, url
+    save_high_water(state, newest)
+
+
+def needs_full_scan(high_water, now):
+    return high_water is None or now - high_water > RC_MAX_AGE
+
+
+def connect(host=SITE, **kwargs):
+    """Open an mwclient session.  Extra arguments (scheme, path, etc)
+    are passed through to mwclient.Site.
+
+    """
+    return mwclient.Site(host, clients_useragent=USER_AGENT, **kwargs)
+
+
+def full_scan(site):
+    """Yield (title, url) for every AFF link on the wiki.
+
+    exturlusage only searches one protocol at a time (mwclient defaults
+    to http), so ask for both.  Protocol-relative links are stored, and
+    so reported, under both.
+
+    """
+    for protocol in ('http', 'https'):
+        for link in site.exturlusage(AFF_DOMAIN, protocol=protocol):
+            yield link['title'], link['url']
+
+
+def recent_changes(site, since):
+    """Yield (title, timestamp) for pages edited, created or moved
+    since the given datetime, oldest first.  Moves are reported under
+    the page's new title.
+
+    """
+    changes = site.recentchanges(start=since.strftime(TIMESTAMP_FORMAT),
+                                 dir='newer',
+                                 type='edit|new|log',
+                                 prop='title|timestamp|loginfo')
+    for change in changes:
+        title = change_title(change)
+        if title:
+            yield title, parse_timestamp(change['timestamp'])
+
+
+def change_title(change):
+    """Return the title whose links a recentchanges entry may have
+    changed, or None for log entries other than moves.  Understands both
+    the recentchanges API names (logtype, logparams) and the EventStreams
+    ones (log_type, log_params).
+
+    """
+    if change.get('type') != 'log':
+        return change['title']
+    if change.get('logtype', change.get('log_type')) == 'move':
+        params = change.get('logparams', change.get('log_params', {}))
+        return params.get('target_title', params.get('target'))
+    return None
+
+
+def feed_changes(path, since):
+    """Same as recent_changes(), but reads from a local file.  Each line
+    is a JSON object with (at least) "title" and "timestamp" keys, as in
+    a dump of the recentchanges API or EventStreams.  Timestamps may be
+    ISO 8601 strings or Unix times.
+
+    """
+    with path.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            title = change_title(change)
+            timestamp = parse_timestamp(change['timestamp'])
+            if title and timestamp >= since:
+                yield title, timestamp
+
+
+def aff_links(page):
+    """Yield the AFF links currently on a page."""
+    for url in page.extlinks():
+        if urllib.parse.urlsplit(url).hostname == AFF_DOMAIN:
+            yield url
+
+
+def parse_timestamp(timestamp):
+    if isinstance(timestamp, (int, float)):
+        return datetime.datetime.utcfromtimestamp(timestamp)
+    return datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+def load_high_water(path):
+    """Return the high-water datetime from the state file, or None if
+    there hasn't been a previous run.
+
+    """
+    try:
+        with path.open() as f:
+            return parse_timestamp(json.load(f)['high_water'])
+    except FileNotFoundError:
+        return None
+
+
+def save_high_water(path, timestamp):
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('w') as f:
+        json.dump({'high_water': timestamp.strftime(TIMESTAMP_FORMAT)}, f)
+    tmp.replace(path)
+
 
 if __name__ == '__main__':
     main()
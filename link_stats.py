@@ -0,0 +1,318 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+"""Streaming statistics over harvested AFF links
+
+Reads the output of find_links_multi_db.py or get_links.py --incremental
+and counts, weighted by the number of linking pages, which endpoints,
+programs, datasets, tables and failure reasons cover the most links.
+Memory is bounded by keeping a fixed number of counters per dimension
+(the Space-Saving algorithm), so it works on inputs far larger than RAM.
+Summaries can be dumped to JSON and merged, so the input can be split
+between parallel workers.
+"""
+
+import sys
+import heapq
+import json
+import argparse
+import warnings
+from urllib.parse import urlparse, parse_qs
+
+import transform
+
+DIMENSIONS = ("endpoint", "program", "dataset", "table", "status", "reason")
+
+
+class SpaceSaving:
+    """Approximate top-k counter using a fixed number of slots
+
+    Each key's count is an overestimate by at most its recorded error,
+    and any key whose true count exceeds total / capacity is guaranteed
+    to be present.
+
+    The smallest counter is found with a min-heap of (count, key) entries.
+    Entries go stale when a count changes and are skipped when popped; the
+    heap is rebuilt once stale entries outnumber live ones, which keeps
+    both memory and the amortized cost of add() bounded.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+
+    def add(self, key, weight=1):
+        self.total += weight
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            # Evict the smallest counter and let the new key inherit it
+            floor, victim = self.pop_smallest()
+            del self.counts[victim]
+            del self.errors[victim]
+            self.counts[key] = floor + weight
+            self.errors[key] = floor
+
+        if len(self.heap) >= 2 * self.capacity:
+            self.rebuild_heap()
+        else:
+            heapq.heappush(self.heap, (self.counts[key], key))
+
+    def pop_smallest(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    def rebuild_heap(self):
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def merge(self, other):
+        """Fold another summary into this one
+
+        A key missing from a full summary may still have occurred there as
+        often as that summary's smallest counter, so that minimum is added
+        to both the count and the error of such keys.  This keeps the
+        guarantees above for the merged summary.
+        """
+        own_floor = self.floor()
+        other_floor = other.floor()
+        counts = {}
+        errors = {}
+        for key in set(self.counts) | set(other.counts):
+            counts[key] = self.counts.get(key, own_floor) + other.counts.get(
+                key, other_floor
+            )
+            errors[key] = self.errors.get(key, own_floor) + other.errors.get(
+                key, other_floor
+            )
+        keep = sorted(counts, key=lambda key: (-counts[key], key))[: self.capacity]
+        self.total += other.total
+        self.counts = {key: counts[key] for key in keep}
+        self.errors = {key: errors[key] for key in keep}
+        self.rebuild_heap()
+
+    def floor(self):
+        """The most a key that isn't being counted can have occurred"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def top(self, n=None):
+        """Returns (key, count, error) tuples, largest count first"""
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, count, self.errors[key]) for key, count in ranked[:n]]
+
+    def to_dict(self):
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "counts": self.counts,
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        counter = cls(data["capacity"])
+        counter.total = data["total"]
+        counter.counts = data["counts"]
+        counter.errors = data["errors"]
+        counter.rebuild_heap()
+        return counter
+
+
+class LinkStats:
+    """One SpaceSaving counter for each of DIMENSIONS"""
+
+    def __init__(self, capacity=1000):
+        self.counters = {dim: SpaceSaving(capacity) for dim in DIMENSIONS}
+
+    def add(self, url, weight=1):
+        for dim, value in classify(url).items():
+            if value:
+                self.counters[dim].add(value, weight)
+
+    def merge(self, other):
+        for dim in DIMENSIONS:
+            self.counters[dim].merge(other.counters[dim])
+
+    def to_dict(self):
+        return {dim: counter.to_dict() for dim, counter in self.counters.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.counters = {dim: SpaceSaving.from_dict(data[dim]) for dim in DIMENSIONS}
+        return stats
+
+    def report(self, n=20, file=sys.stdout):
+        for dim in DIMENSIONS:
+            counter = self.counters[dim]
+            print("== {0} (total {1}) ==".format(dim, counter.total), file=file)
+            for key, count, error in counter.top(n):
+                share = 100 * count / counter.total if counter.total else 0
+                bound = " (+/- {0})".format(error) if error else ""
+                print(
+                    "{0:>10}{1} {2:5.1f}%  {3}".format(count, bound, share, key),
+                    file=file,
+                )
+            print(file=file)
+
+
+def describe(url):
+    """Splits an AFF URL into (endpoint, program, dataset, table)
+
+    Any part that can't be determined is returned as an empty string.
+    """
+    parsed = urlparse(url)
+    path = parsed.path.split("/")[1:]
+    query = parse_qs(parsed.query)
+    program = dataset = table = ""
+
+    if path[:1] == ["bkmk"]:
+        endpoint = "/".join(path[:2])
+        if path[1:2] == ["table"]:
+            fields = dict(zip(transform.aff_table, path[2:]))
+            program = fields.get("program", "")
+            dataset = fields.get("dataset", "")
+            table = fields.get("product", "")
+    elif path[:1] == ["faces"]:
+        endpoint = "faces/" + path[-1]
+        pid = query.get("pid", [""])[0].split("_")
+        if len(pid) >= 3:
+            program, dataset, table = pid[0], "_".join(pid[1:-1]), pid[-1]
+    elif path[:1] == ["servlet"]:
+        endpoint = "/".join(path[:2])
+        ds_name = query.get("-ds_name", [""])[0].split("_")
+        if len(ds_name) >= 3:
+            program, dataset = ds_name[0], "_".join(ds_name[1:3])
+        table = query.get("-_box_head_nbr", [""])[0]
+    else:
+        endpoint = path[0] if path else ""
+
+    return endpoint, program, dataset, table
+
+
+def classify(url):
+    """Returns the value of each of DIMENSIONS for one URL"""
+    endpoint, program, dataset, table = describe(url)
+    rejected = transform.triage(url)
+    if rejected:
+        status = rejected[0].__name__
+        reason = "{0}: {1}".format(status, rejected[1])
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                transform.main(url)
+            except Exception as err:
+                status = type(err).__name__
+                reason = "{0}: {1}".format(status, err)
+            else:
+                status = "converted"
+                reason = ""
+    return {
+        "endpoint": endpoint,
+        "program": program,
+        "dataset": program and dataset and program + "/" + dataset,
+        "table": program and table and "/".join((program, dataset, table)),
+        "status": status,
+        "reason": reason,
+    }
+
+
+def read_links(lines):
+    """Parses harvester output into (source, url, pages) tuples
+
+    Understands the "db_name url count" lines of find_links_multi_db.py
+    and the "title<TAB>url" lines of get_links.py --incremental.
+    Lines without a URL (such as the bare titles printed by get_links.py
+    without --incremental) are skipped, with a count on stderr at the end.
+    """
+    skipped = 0
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        if "\t" in line:
+            source, _, url = line.partition("\t")
+            pages = 1
+        else:
+            fields = line.split()
+            if len(fields) == 3 and fields[2].isdigit():
+                source, url, pages = fields[0], fields[1], int(fields[2])
+            elif len(fields) == 1:
+                source, url, pages = "", fields[0], 1
+            else:
+                skipped += 1
+                continue
+        if "//" in url:
+            yield source, url, pages
+        else:
+            skipped += 1
+
+    if skipped:
+        print(
+            "read_links: skipped {0} line(s) without a URL".format(skipped),
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rank AFF links by endpoint, program, dataset, table "
+        "and conversion failure reason",
+        prog="link_stats.py",
+    )
+    parser.add_argument(
+        "infile",
+        nargs="*",
+        type=argparse.FileType("r"),
+        default=[sys.stdin],
+        help="Output of find_links_multi_db.py or get_links.py --incremental",
+    )
+    parser.add_argument(
+        "-k",
+        "--capacity",
+        type=int,
+        default=1000,
+        help="Number of counters to keep per dimension",
+    )
+    parser.add_argument(
+        "-n", "--top", type=int, default=20, help="Number of entries to report"
+    )
+    parser.add_argument(
+        "--dump",
+        type=argparse.FileType("w"),
+        help="Write the summary as JSON instead of a report, for --merge",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        type=argparse.FileType("r"),
+        default=[],
+        help="Summaries written by --dump to merge instead of reading links",
+    )
+    args = parser.parse_args()
+
+    stats = LinkStats(args.capacity)
+    if args.merge:
+        for f in args.merge:
+            stats.merge(LinkStats.from_dict(json.load(f)))
+    else:
+        for f in args.infile:
+            for source, url, pages in read_links(f):
+                stats.add(url, pages)
+
+    if args.dump:
+        json.dump(stats.to_dict(), args.dump)
+    else:
+        stats.report(args.top)
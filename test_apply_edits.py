@@ -0,0 +1,255 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+import json
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+mwclient = pytest.importorskip("mwclient")
+import apply_edits  # noqa: E402
+import get_links  # noqa: E402
+
+OLD = "https://factfinder.census.gov/bkmk/table/1.0/en/DEC/10_113/H1"
+NEW = "https://data.census.gov/cedsci/table?tid=DECENNIALCD1132010.H1&y=2010"
+OTHER = "https://factfinder.census.gov/bkmk/table/1.0/en/NES/2016/00A1"
+OTHER_NEW = "https://data.census.gov/cedsci/table?tid=NONEMP2016.NS1600NONEMP&y=2016"
+PEP = "https://factfinder.census.gov/bkmk/table/1.0/en/PEP/2017/PEPANNRES"
+DEC = "http://factfinder.census.gov/bkmk/table/1.0/en/DEC/10_SF1/H10"
+DEC_NEW = "https://data.census.gov/cedsci/table?tid=DECENNIALSF12010.H10&y=2010"
+
+
+class FakeWiki(BaseHTTPRequestHandler):
+    """Just enough of api.php for mwclient to read and edit pages"""
+
+    pages = {}
+    edits = []
+    ratelimit = 0
+    conflicts = set()
+    blacklisted = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+    def respond(self, params):
+        params = {key: values[0] for key, values in params.items()}
+        if params.get("action") == "edit":
+            result = self.edit(params)
+        else:
+            result = self.query(params)
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query(self, params):
+        meta = params.get("meta", "").split("|")
+        query = {}
+        if "siteinfo" in meta:
+            query["general"] = {"generator": "MediaWiki 1.35.0", "writeapi": ""}
+            query["namespaces"] = {"0": {"id": 0, "*": ""}}
+        if "userinfo" in meta:
+            query["userinfo"] = {"id": 1, "name": "Bot", "rights": ["read", "edit"]}
+        if "tokens" in meta:
+            query["tokens"] = {"csrftoken": "token+\\"}
+        if "titles" in params:
+            title = params["titles"]
+            page = {"ns": 0, "title": title}
+            if title in self.pages:
+                page["pageid"] = 1
+                if "revisions" in params.get("prop", ""):
+                    page["revisions"] = [
+                        {
+                            "timestamp": "2020-01-01T00:00:00Z",
+                            "slots": {"main": {"*": self.pages[title]}},
+                        }
+                    ]
+            else:
+                page["missing"] = ""
+            query["pages"] = {str(page.get("pageid", -1)): page}
+        return {"query": query}
+
+    def edit(self, params):
+        title = params["title"]
+        if FakeWiki.ratelimit:
+            FakeWiki.ratelimit -= 1
+            return {"error": {"code": "ratelimited", "info": "Slow down"}}
+        if title in self.conflicts:
+            self.conflicts.remove(title)
+            return {"error": {"code": "editconflict", "info": "Edit conflict."}}
+        if title in self.blacklisted:
+            self.edits.append("rejected " + title)
+            return {"edit": {"result": "Failure", "spamblacklist": "example.com"}}
+        self.pages[params["title"]] = params["text"]
+        self.edits.append(params["title"])
+        return {"edit": {"result": "Success", "newtimestamp": "2020-01-02T00:00:00Z"}}
+
+
+@pytest.fixture
+def site():
+    FakeWiki.pages = {
+        "Foo": "See [{0} here] and [{1} there] and [{2} PEP].".format(
+            OLD, OTHER, PEP
+        ),
+        "Bar": "Nothing to see",
+    }
+    FakeWiki.edits = []
+    FakeWiki.ratelimit = 1
+    FakeWiki.conflicts = set()
+    FakeWiki.blacklisted = set()
+    server = HTTPServer(("127.0.0.1", 0), FakeWiki)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield get_links.connect(
+        "127.0.0.1:{0}".format(server.server_port),
+        scheme="http",
+        path="/",
+        force_login=False,
+    )
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_apply_all(site, tmp_path, monkeypatch):
+    monkeypatch.setattr(apply_edits, "RATELIMIT_BACKOFF", 0)
+    lines = [
+        "Foo\t" + OLD,
+        "Foo\t" + OTHER,
+        "Foo\t" + PEP,
+        "Bar\t" + OLD,
+        "Baz\t" + OLD,
+        "Qux\t" + PEP,
+    ]
+    pages = apply_edits.group_by_page(lines)
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    statuses = apply_edits.apply_all(
+        site, pages, progress, apply_edits.Throttle(0), workers=2
+    )
+    progress.close()
+
+    assert statuses == {"saved": 1, "unmatched": 1, "missing": 1, "unconvertible": 1}
+    assert FakeWiki.edits == ["Foo"]
+    assert FakeWiki.ratelimit == 0
+    assert FakeWiki.pages["Foo"] == (
+        "See [{0} here] and [{1} there] and [{2} PEP].".format(NEW, OTHER_NEW, PEP)
+    )
+
+    # A second run resumes from the progress file; only Bar's link, which
+    # wasn't found in the page, is tried again
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    assert progress.done == {
+        ("Foo", OLD),
+        ("Foo", OTHER),
+        ("Foo", PEP),
+        ("Baz", OLD),
+        ("Qux", PEP),
+    }
+    statuses = apply_edits.apply_all(site, pages, progress, apply_edits.Throttle(0))
+    progress.close()
+    assert statuses == {"unmatched": 1}
+    assert FakeWiki.edits == ["Foo"]
+
+    # A later harvest finds a new link on Foo, which gets its own edit
+    FakeWiki.pages["Foo"] += " Also {0}.".format(DEC)
+    pages = apply_edits.group_by_page(lines + ["Foo\t" + DEC])
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    statuses = apply_edits.apply_all(site, pages, progress, apply_edits.Throttle(0))
+    progress.close()
+    assert statuses == {"saved": 1, "unmatched": 1}
+    assert FakeWiki.edits == ["Foo", "Foo"]
+    assert FakeWiki.pages["Foo"].endswith(" Also {0}.".format(DEC_NEW))
+
+
+def test_edit_conflict_and_failure(site, tmp_path):
+    FakeWiki.ratelimit = 0
+    FakeWiki.pages["Bar"] = "[{0} x]".format(OLD)
+    FakeWiki.conflicts = {"Foo"}
+    FakeWiki.blacklisted = {"Bar"}
+    pages = apply_edits.group_by_page(["Foo\t" + OLD, "Bar\t" + OLD])
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    statuses = apply_edits.apply_all(site, pages, progress, apply_edits.Throttle(0))
+    progress.close()
+
+    # The conflict is retried, the rejected edit is not
+    assert statuses == {"saved": 1, "failed: spamblacklist": 1}
+    assert sorted(FakeWiki.edits) == ["Foo", "rejected Bar"]
+
+    # Only the final outcome counts as done, so resuming retries Bar
+    FakeWiki.blacklisted = set()
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    assert progress.done == {("Foo", OLD)}
+    statuses = apply_edits.apply_all(site, pages, progress, apply_edits.Throttle(0))
+    progress.close()
+    assert statuses == {"saved": 1}
+    assert FakeWiki.pages["Bar"] == "[{0} x]".format(NEW)
+
+
+class BrokenPages:
+    def __getitem__(self, title):
+        raise mwclient.errors.AssertUserFailedError()
+
+
+def test_unexpected_errors(tmp_path):
+    site = types.SimpleNamespace(pages=BrokenPages())
+    pages = apply_edits.group_by_page(["Foo\t" + OLD, "Bar\t" + OTHER])
+    progress = apply_edits.Progress(tmp_path / "progress.jsonl")
+    statuses = apply_edits.apply_all(site, pages, progress, apply_edits.Throttle(0))
+    progress.close()
+
+    assert statuses == {"error: AssertUserFailedError": 2}
+    assert not apply_edits.Progress(tmp_path / "progress.jsonl").done
+    assert len((tmp_path / "progress.jsonl").read_text().splitlines()) == 2
+
+
+def test_replace_links_prefix():
+    short = "https://factfinder.census.gov/bkmk/table/1.0/en/ACS/13_5YR/B07010"
+    long = short + "/0100000US|0400000US01"
+    conversions = apply_edits.convert([short, long])
+    assert set(conversions) == {short, long}
+    text = (
+        "* {0}\n"
+        "* [{1} label]\n"
+        "* {{{{cite web|url={0}|title=T}}}}\n"
+        "* <ref>{1}</ref>\n"
+    ).format(short, long)
+    assert apply_edits.replace_links(text, conversions) == (
+        (
+            "* {0}\n"
+            "* [{1} label]\n"
+            "* {{{{cite web|url={0}|title=T}}}}\n"
+            "* <ref>{1}</ref>\n"
+        ).format(conversions[short], conversions[long]),
+        {short, long},
+    )
+
+
+def test_replace_links_boundaries():
+    conversions = apply_edits.convert([OLD])
+    archived = "https://web.archive.org/web/2019/" + OLD
+    text = (
+        "{{{{cite web|url={0}|archive-url={1}}}}}\n"
+        "See {0}. Or {0}, or ({0})\n"
+        "{0}x and x{0} are other urls\n"
+    ).format(OLD, archived)
+    assert apply_edits.replace_links(text, conversions) == (
+        (
+            "{{{{cite web|url={0}|archive-url={1}}}}}\n"
+            "See {0}. Or {0}, or ({2})\n"
+            "{2}x and x{2} are other urls\n"
+        ).format(NEW, archived, OLD),
+        {OLD},
+    )
@@ -0,0 +1,43 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+import dedup_links
+
+
+def test_dedup_spills():
+    links = [
+        ("enwiki_p", "http://b", 3),
+        ("dewiki_p", "http://a", 1),
+        ("enwiki_p", "http://a", 2),
+        ("frwiki_p", "http://b", 4),
+        ("enwiki_p", "http://b", 3),
+    ]
+    expected = [("http://a", 3, 2), ("http://b", 7, 2)]
+    assert list(dedup_links.dedup(links)) == expected
+    assert list(dedup_links.dedup(links, max_entries=1)) == expected
+
+
+def test_dedup_fan_in():
+    links = [
+        ("wiki{0}".format(i % 7), "http://{0}".format(i % 13), i % 5)
+        for i in range(500)
+    ]
+    expected = list(dedup_links.dedup(links))
+    assert len(expected) == 13
+    assert list(dedup_links.dedup(links, max_entries=3, fan_in=2)) == expected
+    assert list(dedup_links.dedup(links, max_entries=5, fan_in=3)) == expected
+
+
+def test_dedup_utf8(tmp_path):
+    links = [("dewiki_p", "http://b/Zürich", 1), ("enwiki_p", "http://a/São", 2)]
+    expected = [("http://a/São", 2, 1), ("http://b/Zürich", 1, 1)]
+    result = dedup_links.dedup(links, max_entries=1, tmpdir=str(tmp_path))
+    assert list(result) == expected
+
+
+def test_dedup_fan_in_too_small():
+    with pytest.raises(ValueError):
+        dedup_links.dedup([("enwiki_p", "http://a", 1)], max_entries=1, fan_in=1)
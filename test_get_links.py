@@ -0,0 +1,136 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+import datetime
+import json
+
+import pytest
+
+pytest.importorskip("mwclient")
+import get_links  # noqa: E402
+
+AFF = "https://factfinder.census.gov/bkmk/table/1.0/en/DEC/10_113/H1"
+
+
+class FakePage:
+    def __init__(self, links):
+        self.links = links
+
+    def extlinks(self):
+        return iter(self.links)
+
+
+class FakeSite:
+    def __init__(self, pages, changes=()):
+        self.pages = pages
+        self.changes = changes
+        self.rc_kwargs = None
+
+    def exturlusage(self, query, protocol="http"):
+        # Like the real API, only links with the given protocol match, and
+        # protocol-relative links are listed under both
+        for title, page in sorted(self.pages.items()):
+            for url in page.links:
+                if url.startswith("//"):
+                    url = protocol + ":" + url
+                if url.startswith(protocol + "://" + query):
+                    yield {"title": title, "url": url}
+
+    def recentchanges(self, **kwargs):
+        self.rc_kwargs = kwargs
+        return iter(self.changes)
+
+
+def test_high_water_round_trip(tmp_path):
+    state = tmp_path / "state.json"
+    assert get_links.load_high_water(state) is None
+    mark = datetime.datetime(2020, 3, 4, 5, 6, 7)
+    get_links.save_high_water(state, mark)
+    assert get_links.load_high_water(state) == mark
+
+
+def test_needs_full_scan():
+    now = datetime.datetime(2020, 3, 31)
+    assert get_links.needs_full_scan(None, now)
+    assert get_links.needs_full_scan(now - datetime.timedelta(days=31), now)
+    assert not get_links.needs_full_scan(now - datetime.timedelta(days=29), now)
+
+
+def test_feed_changes(tmp_path):
+    feed = tmp_path / "feed.jsonl"
+    lines = [
+        {"title": "Old", "timestamp": "2020-01-01T00:00:00Z"},
+        {"title": "New", "timestamp": "2020-01-03T00:00:00Z"},
+        {"title": "Unix", "timestamp": 1578009600},  # 2020-01-03
+        {
+            "title": "Moved",
+            "type": "log",
+            "log_type": "move",
+            "log_params": {"target": "Moved to"},
+            "timestamp": 1578009600,
+        },
+        {
+            "title": "Deleted",
+            "type": "log",
+            "log_type": "delete",
+            "timestamp": 1578009600,
+        },
+    ]
+    feed.write_text("\n".join(json.dumps(line) for line in lines) + "\n\n")
+    since = datetime.datetime(2020, 1, 2)
+    assert [title for title, _ in get_links.feed_changes(feed, since)] == [
+        "New",
+        "Unix",
+        "Moved to",
+    ]
+
+
+def test_incremental(tmp_path):
+    state = tmp_path / "state.json"
+    site = FakeSite(
+        {"A": FakePage([AFF, "https://example.com/"]), "B": FakePage([AFF])},
+        changes=[
+            {"type": "edit", "title": "B", "timestamp": "2020-01-05T00:00:00Z"},
+            {
+                "type": "log",
+                "title": "C",
+                "logtype": "move",
+                "logparams": {"target_title": "A"},
+                "timestamp": "2020-01-06T00:00:00Z",
+            },
+        ],
+    )
+    now = datetime.datetime(2020, 1, 4)
+
+    # No state yet, so everything is scanned
+    links = list(get_links.incremental(site, state, now=now))
+    assert links == [("A", AFF), ("B", AFF)]
+    assert get_links.load_high_water(state) == now
+    assert site.rc_kwargs is None
+
+    # Then only the changed pages, with moves under their new title
+    later = datetime.datetime(2020, 1, 7)
+    links = list(get_links.incremental(site, state, now=later))
+    assert links == [("B", AFF), ("A", AFF)]
+    assert site.rc_kwargs["start"] == "2020-01-04T00:00:00Z"
+    assert get_links.load_high_water(state) == datetime.datetime(2020, 1, 6)
+
+    # A mark older than RC_MAX_AGE falls back to a full scan
+    site.rc_kwargs = None
+    much_later = datetime.datetime(2020, 3, 1)
+    assert len(list(get_links.incremental(site, state, now=much_later))) == 2
+    assert site.rc_kwargs is None
+    assert get_links.load_high_water(state) == much_later
+
+
+def test_full_scan_both_protocols():
+    http = "http://factfinder.census.gov/bkmk/table/1.0/en/DEC/10_SF1/H10"
+    relative = "//factfinder.census.gov/bkmk/table/1.0/en/NES/2016/00A1"
+    site = FakeSite({"A": FakePage([http, AFF]), "B": FakePage([relative])})
+    assert sorted(get_links.full_scan(site)) == [
+        ("A", http),
+        ("A", AFF),
+        ("B", "http:" + relative),
+        ("B", "https:" + relative),
+    ]
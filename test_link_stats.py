@@ -0,0 +1,123 @@
+#!/bin/env python3
+# python 3.5+
+# SPDX-License-Identifier: MIT
+
+import random
+
+import link_stats
+
+
+def test_space_saving_exact_under_capacity():
+    counter = link_stats.SpaceSaving(3)
+    for key in "aabbbc":
+        counter.add(key)
+    assert counter.top() == [("b", 3, 0), ("a", 2, 0), ("c", 1, 0)]
+    assert counter.total == 6
+
+
+def test_space_saving_bounded():
+    counter = link_stats.SpaceSaving(2)
+    for key in "aaaaaaaaaabcdefg":
+        counter.add(key)
+    assert len(counter.counts) == 2
+    assert counter.top(1)[0][:2] == ("a", 10)
+
+
+def test_space_saving_merge():
+    left = link_stats.SpaceSaving(2)
+    right = link_stats.SpaceSaving(2)
+    left.add("a", 5)
+    left.add("b", 1)
+    right.add("a", 2)
+    right.add("c", 3)
+    left.merge(link_stats.SpaceSaving.from_dict(right.to_dict()))
+    assert left.total == 11
+    # Both summaries are full, so c might have been seen in left as often
+    # as left's smallest counter (b, 1): c is 3 or 4 and b is 1 to 3
+    assert left.top() == [("a", 7, 0), ("c", 4, 1)]
+
+
+def test_classify():
+    url = (
+        "https://factfinder.census.gov/bkmk/table/1.0/en/PEP/2017/"
+        "PEPANNRES/0100000US.31000"
+    )
+    assert link_stats.classify(url) == {
+        "endpoint": "bkmk/table",
+        "program": "PEP",
+        "dataset": "PEP/2017",
+        "table": "PEP/2017/PEPANNRES",
+        "status": "UnsupportedCensusData",
+        "reason": "UnsupportedCensusData: PEP not yet available in CEDSCI",
+    }
+
+
+def test_read_links():
+    lines = [
+        "enwiki_p http://factfinder.census.gov/servlet/SAFFFacts 12\n",
+        "Foo, Alabama\thttps://factfinder.census.gov/bkmk/cf/1.0/en/zip/1\n",
+        "Bar\n",
+    ]
+    assert list(link_stats.read_links(lines)) == [
+        ("enwiki_p", "http://factfinder.census.gov/servlet/SAFFFacts", 12),
+        ("Foo, Alabama", "https://factfinder.census.gov/bkmk/cf/1.0/en/zip/1", 1),
+    ]
+
+
+def skewed_stream():
+    true_counts = {}
+    stream = []
+    for i in range(1, 2001):
+        key = "k{0}".format(i)
+        true_counts[key] = 2000 // i
+        stream.extend([key] * true_counts[key])
+    random.Random(0).shuffle(stream)
+    return true_counts, stream
+
+
+def check_bounds(counter, true_counts):
+    bound = counter.total / counter.capacity
+    for key, count, error in counter.top():
+        true = true_counts[key]
+        assert count - error <= true <= count, key
+        assert error <= bound
+    for key, true in true_counts.items():
+        if true > bound:
+            assert key in counter.counts
+
+
+def test_space_saving_error_bound():
+    # A skewed stream with far more distinct keys than counters
+    true_counts, stream = skewed_stream()
+    counter = link_stats.SpaceSaving(50)
+    for key in stream:
+        counter.add(key)
+
+    assert counter.total == len(stream)
+    assert len(counter.counts) == 50
+    assert len(counter.heap) < 100
+    check_bounds(counter, true_counts)
+
+
+def test_space_saving_merge_error_bound():
+    true_counts, stream = skewed_stream()
+    half = len(stream) // 2
+    left = link_stats.SpaceSaving(50)
+    right = link_stats.SpaceSaving(50)
+    for key in stream[:half]:
+        left.add(key)
+    for key in stream[half:]:
+        right.add(key)
+    left.merge(link_stats.SpaceSaving.from_dict(right.to_dict()))
+
+    assert left.total == len(stream)
+    assert len(left.counts) == 50
+    check_bounds(left, true_counts)
+
+
+def test_read_links_counts_skipped(capsys):
+    lines = ["Bar\n", "Baz\n", "enwiki_p http://factfinder.census.gov/ 3\n", "\n"]
+    assert list(link_stats.read_links(lines)) == [
+        ("enwiki_p", "http://factfinder.census.gov/", 3)
+    ]
+    assert "skipped 2 line(s)" in capsys.readouterr().err
@@ -218,3 +218,75 @@ def test_integration_invalid():
     assert not r.stdout
     assert "InputError" in r.stderr
     assert r.returncode > 0
+
+
+def test_import_time():
+    # Importing transform and converting a plain URL should not pull in
+    # the CLI-only or data-loading modules
+    code = (
+        "import sys\n"
+        "before = set(sys.modules)\n"
+        "import transform\n"
+        "transform.main('https://factfinder.census.gov/bkmk/table/1.0/en/"
+        "DEC/10_113/H1')\n"
+        "print(' '.join(sorted(set(sys.modules) - before)))\n"
+    )
+    r = subprocess.run(
+        ["python3", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert r.returncode == 0
+    loaded = set(r.stdout.split())
+    assert "transform" in loaded
+    assert not loaded & {"argparse", "json", "traceback"}
+
+
+def test_triage():
+    rejected = [
+        "NotARealURL",
+        "https://factfinder.census.gov/faces/nav/jsf/pages/index.xhtml#none",
+        "https://factfinder.census.gov/nav/jsf/pages/index.xhtml",
+        "http://factfinder.census.gov/bkmk/cf/1.0/en/zip/17215/ALL",
+        "http://factfinder.census.gov/bkmk/navigation/1.0/en/text_search:B07010",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/PEP/2017/"
+        "PEPANNRES/0100000US.31000",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/STC/2015/00A2",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/AHS/2013/C01AO",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/ECN/2012_US/00A1",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/BP/2016/00CZ2",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/ACS/09_5YR/B07010",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/ACS/12_SF4/B07010",
+        "https://factfinder.census.gov/faces/tableservices/jsf/pages/"
+        "productview.xhtml?pid=PEP_2017_PEPANNRES&src=pt",
+        "https://factfinder.census.gov/faces/tableservices/jsf/pages/"
+        "productview.xhtml?pid=ACS_09_5YR_DP05",
+        "https://factfinder.census.gov/faces/tableservices/jsf/pages/"
+        "productview.xhtml?src=bkmk",
+        "http://factfinder.census.gov/servlet/GCTTable?_bm=y"
+        "&-mt_name=PEP_2009_EST_GCTT1R_US9S&-geo_id=01000US",
+        "http://factfinder.census.gov/servlet/ADPTable?_bm=y&-geo_id=01000US"
+        "&-ds_name=ACS_2008_3YR_G00_&-_box_head_nbr=DP5&-format=",
+        "http://factfinder.census.gov/servlet/QTTable?_bm=y&-geo_id=01000US",
+    ]
+    for url in rejected:
+        status = transform.triage(url)
+        assert status is not None, url
+        with pytest.raises(status[0]) as err:
+            transform.main(url)
+        assert type(err.value) is status[0]
+        assert str(err.value) == status[1]
+
+    maybe = [
+        "https://factfinder.census.gov/bkmk/table/1.0/en/ACS/13_5YR/B07010",
+        "https://factfinder.census.gov/bkmk/table/1.0/en/DEC/10_113/H1",
+        "http://factfinder.census.gov/servlet/SAFFFacts?_event=Search"
+        "&geo_id=86000US78516",
+        "https://factfinder.census.gov/faces/tableservices/jsf/pages/"
+        "productview.xhtml?pid=ACS_17_5YR_DP05",
+        "http://factfinder.census.gov/servlet/GCTTable?_bm=y&-geo_id=04000US12"
+        "&-_box_head_nbr=GCT-PH1&-ds_name=DEC_2000_SF1_U&-format=ST-7",
+    ]
+    for url in maybe:
+        assert transform.triage(url) is None
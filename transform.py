@@ -3,17 +3,23 @@
 # SPDX-License-Identifier: MIT
 
 import sys
+import re
 from urllib.parse import urlencode, urlparse, parse_qs
 from collections import OrderedDict
 import warnings
-import traceback
-import json
-import argparse
 import os
 
+# json, argparse and traceback are imported where they are used, so that
+# importing this module (or converting a single URL from the command line)
+# stays cheap. test_import_time checks that this doesn't regress.
+# urllib.parse and warnings stay at the top: build_url and servlet_table
+# need them on every conversion, and the interpreter's own startup (site)
+# usually imports both anyway.
+
 __version__ = "1.2"
 
 transform_data = os.path.join(os.path.dirname(__file__), "transform_data.json")
+_transform_data_cache = {}
 
 aff_table = ("version", "lang", "program", "dataset", "product", "geoids", "codes")
 aff_cf = ("version", "lang", "geo_type", "geo_name", "topic", "object")
@@ -68,6 +74,50 @@ class LowConfidenceTransformation(Warning, Error):
     pass
 
 
+# Programs that dataset_transform rejects whatever the dataset or table,
+# with the exception it raises for each
+rejected_programs = {
+    # Programs not available at all
+    "ASM": (UnsupportedCensusData, "ASM not yet available in CEDSCI"),
+    "COG": (UnsupportedCensusData, "COG not yet available in CEDSCI"),
+    "CFS": (UnsupportedCensusData, "CFS not yet available in CEDSCI"),
+    "PEP": (UnsupportedCensusData, "PEP not yet available in CEDSCI"),
+    "AHS": (UnsupportedCensusData, "AHS uses a different data access system"),
+    "PP": (UnsupportedCensusData, "PP uses a different data access system"),
+    "GEP": (UnsupportedCensusData, "GEP uses a different data access system"),
+    "SSF": (UnsupportedCensusData, "SSF uses a different data access system"),
+    "SGF": (UnsupportedCensusData, "SGF uses a different data access system"),
+    "STC": (UnsupportedCensusData, "STC uses a different data access system"),
+    "BES": (UnsupportedCensusData, "BES uses a different data access system"),
+    "SLF": (UnsupportedCensusData, "SLF uses a different data access system"),
+    "EEO": (UnsupportedCensusData, "2010 EEO data not available on CEDSCI"),
+    # TODO: Data likely exists, but tables don't line up
+    "ECN": (NotImplementedError, "ECN tables don't line up between AFF and CEDSCI"),
+    # TODO No matter what the US Census Bureau says, CB1600CZ21 != CB1600ZBP
+    "BP": (
+        NotImplementedError,
+        "Table IDs for business patterns are not consistent between AFF and CEDSCI",
+        # year = dataset
+        # if int(year) < 2012 and survey == "CBP":
+        #     raise UnsupportedCensusData(
+        #         "Pre-2012 County Business Patterns not available in CEDSCI"
+        #     )
+    ),
+}
+
+digits = re.compile(r"[0-9]+\Z")
+servlet_facts_targets = {"SAFFFacts", "ACSSAFFFacts", "SAFFPopulation"}
+servlet_table_keys = {
+    "GCTTable": "-mt_name",
+    "QTTable": "-qr_name",
+    "DTTable": "-mt_name",
+}
+faces_url = re.compile(r"https?://[^/?#]*/faces/")
+productview_url = re.compile(
+    r"https?://[^/?#]*/[^?#]*/productview\.xhtml(;[^/?#]*)?([?#]|$)"
+)
+
+
 def main(raw_url):
     # remove protocol scheme
     scheme, sep, old_url = raw_url.partition("//")
@@ -99,7 +149,7 @@ def main(raw_url):
         parsed = urlparse(raw_url)
         tool, target = parsed.path.split("/")[1:]
         data = OrderedDict(parse_qs(parsed.query))
-        if target in {"SAFFFacts", "ACSSAFFFacts", "SAFFPopulation"}:
+        if target in servlet_facts_targets:
             new_url = servlet_facts(data)
         else:
             new_url = servlet_table(target, data)
@@ -110,6 +160,103 @@ def main(raw_url):
     return build_url(new_url)
 
 
+def triage(raw_url):
+    """Cheaply checks whether main(raw_url) is certain to fail
+
+    Returns None if the URL might be convertible, in which case it should
+    be passed to main().  Otherwise returns (exception class, message) for
+    the error main() would raise, without converting the URL or raising
+    anything.  Meant for batch callers where most links can't be converted.
+    """
+    scheme, sep, old_url = raw_url.partition("//")
+    if not sep:
+        return InputError, "Input is not a valid URL"
+
+    parts = old_url.partition("?")[0].split("/")
+    if len(parts) < 3:
+        return None
+    tool, target = parts[1:3]
+
+    if tool == "bkmk":
+        if target == "table":
+            # domain/bkmk/table/version/lang/program/dataset/product
+            if len(parts) < 8:
+                return None
+            return triage_dataset(*parts[5:7])
+        elif target == "cf":
+            if parts[5:6] == ["zip"]:
+                return (
+                    UnsupportedCensusData,
+                    "CEDSCI does not support profiles for zipcodes",
+                )
+        else:
+            return NotImplementedError, "No transformation rule for that data type"
+    elif tool == "faces":
+        if faces_url.match(raw_url) and not productview_url.match(raw_url):
+            return InputError, "Not a stable deep link"
+        parsed = urlparse(raw_url)
+        if parsed.path.split("/")[-1] == "productview.xhtml":
+            pid = parse_qs(parsed.query).get("pid")
+            if not pid:
+                return InputError, "Not a stable deep link"
+            # Same split as productview_pid
+            pid_data = pid[0].split("_")
+            return triage_dataset(pid_data[0], "_".join(pid_data[1:-1]))
+    elif tool == "servlet":
+        return triage_servlet(raw_url)
+    else:
+        return InputError, "Not a stable deep link"
+
+    return None
+
+
+def triage_servlet(raw_url):
+    """triage() for /servlet/ table links, following servlet_table"""
+    parsed = urlparse(raw_url)
+    path = parsed.path.split("/")[1:]
+    if len(path) != 2 or path[1] in servlet_facts_targets:
+        return None
+
+    data = parse_qs(parsed.query)
+    table_name = data.get(servlet_table_keys.get(path[1], ""), [""])[0]
+    if not table_name:
+        if "-ds_name" not in data or "-_box_head_nbr" not in data:
+            return (
+                NotImplementedError,
+                "No transformation rule for that servlet or insufficient data",
+            )
+        table_name = "_".join(
+            (
+                data["-ds_name"][0],
+                data["-_box_head_nbr"][0],
+                data.get("-format", [""])[0].replace("-", ""),
+            )
+        )
+
+    table_data = table_name.split("_")
+    if len(table_data) < 5 or (table_data[4] == "U" and len(table_data) < 6):
+        return None
+    program, year, dataset = table_data[0:3]
+    return triage_dataset(program, dataset, year)
+
+
+def triage_dataset(program, dataset, year=""):
+    """triage() for the checks at the start of dataset_transform
+
+    Only covers rejected_programs and the ACS dataset and year rules.
+    """
+    if program in rejected_programs:
+        return rejected_programs[program]
+    elif program == "ACS":
+        if not year:
+            year = "20" + dataset[0:2]
+        if not dataset.endswith("YR"):
+            return UnsupportedCensusData, "Dataset does not exist on CEDSCI"
+        elif digits.match(year) and int(year) < 2010:
+            return UnsupportedCensusData, "Pre-2010 ACS data not available on CEDSCI"
+    return None
+
+
 # /bkmk/
 def table(data):
     """Transforms AFF table URL data to CEDSCI table URL data"""
@@ -145,8 +292,7 @@ def cf(data):
 
 def servlet_table(servlet, data):
     """Transforms AFF /servlet/ links to CEDSCI table links"""
-    keys = {"GCTTable": "-mt_name", "QTTable": "-qr_name", "DTTable": "-mt_name"}
-    table_name = data.get(keys.get(servlet, ""), [""])[0]
+    table_name = data.get(servlet_table_keys.get(servlet, ""), [""])[0]
     if not table_name:
         try:
             table_name = "_".join(
@@ -210,12 +356,22 @@ def servlet_facts(data):
 
 def short_state_id_to_name(stateid):
     """Converts a state-level GEOID to a state name. Requires transform_data.json"""
-    with open(transform_data) as f:
-        data = json.load(f)["states"]
+    data = load_transform_data("states")
 
     return data[stateid.partition("US")[2][-2:]]
 
 
+def load_transform_data(key):
+    """Returns one section of transform_data.json, reading the file only once"""
+    if not _transform_data_cache:
+        import json
+
+        with open(transform_data) as f:
+            _transform_data_cache.update(json.load(f))
+
+    return _transform_data_cache[key]
+
+
 def productview_pid(data):
     """Converts a productview.xhtml?pid= url"""
     pid = data["pid"]
@@ -240,8 +396,7 @@ def popgroup_lookup(popgroup_list):
 
     Raises an exception if the POPGROUP is not found.
     """
-    with open(transform_data) as f:
-        popgroups = json.load(f)["topics"]
+    popgroups = load_transform_data("topics")
 
     popgroup_strs = []
     for popgroup_id in popgroup_list.split("|"):
@@ -258,26 +413,9 @@ def dataset_transform(program, dataset, ds_table, year=""):
     other datasets will just plain become unavailable.
     """
     survey = ""
-    # Programs not available at all
-    if program in {"ASM", "COG", "CFS", "PEP"}:
-        raise UnsupportedCensusData(program + " not yet available in CEDSCI")
-    elif program in {"AHS", "PP", "GEP", "SSF", "SGF", "STC", "BES", "SLF"}:
-        raise UnsupportedCensusData(program + " uses a different data access system")
-    elif program == "EEO":
-        raise UnsupportedCensusData("2010 EEO data not available on CEDSCI")
-    elif program == "ECN":
-        # TODO: Data likely exists, but tables don't line up
-        raise NotImplementedError("ECN tables don't line up between AFF and CEDSCI")
-    elif program == "BP":
-        # TODO No matter what the US Census Bureau says, CB1600CZ21 != CB1600ZBP
-        raise NotImplementedError(
-            "Table IDs for business patterns are not consistent between AFF and CEDSCI"
-        )
-        # year = dataset
-        # if int(year) < 2012 and survey == "CBP":
-        #     raise UnsupportedCensusData(
-        #         "Pre-2012 County Business Patterns not available in CEDSCI"
-        #     )
+    if program in rejected_programs:
+        error, message = rejected_programs[program]
+        raise error(message)
     # Available or partially-available programs
     elif program == "ACS":
         new_table = ds_table
@@ -354,7 +492,53 @@ def build_url(data):
     return base + query
 
 
-if __name__ == "__main__":
+def convert_all(urls, outfile, verbosity=0, continue_on_err=False):
+    """Converts each URL in urls, writing the results to outfile
+
+    Exits with the status described in the command line help on the
+    first URL that can't be converted, unless continue_on_err is set.
+    """
+    for line in urls:
+        try:
+            result = main(line.strip())
+        except Exception as err:
+            import traceback
+
+            result = ""
+            if verbosity >= 1:
+                traceback.print_exception(
+                    type(err), err, err.__traceback__, file=sys.stderr
+                )
+            elif verbosity >= 0:
+                traceback.print_exception(type(err), err, None, file=sys.stderr)
+
+            if not continue_on_err:
+                if type(err) in {
+                    NotImplementedError,
+                    UnsupportedCensusData,
+                    LowConfidenceTransformation,
+                }:
+                    sys.exit(2)
+                else:
+                    sys.exit(1)
+
+        finally:
+            if result or outfile is not sys.stdout:
+                print(result, file=outfile)
+
+
+def cli(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Fast path for the common case of converting URLs given as arguments
+    # with default options: skip argparse entirely.
+    if argv and not any(arg.startswith("-") for arg in argv):
+        convert_all(argv, sys.stdout)
+        return
+
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Transform US Census American Fact Finder URLs "
         "into data.census.gov URLs",
@@ -407,7 +591,7 @@ if __name__ == "__main__":
         default=0,
         help="Print less information to stderr when things go wrong",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     verbosity = args.verbose - args.quiet
     if args.url:
         input_src = args.url
@@ -417,28 +601,8 @@ if __name__ == "__main__":
     if args.strict:
         warnings.filterwarnings(action="error")
 
-    for line in input_src:
-        try:
-            result = main(line.strip())
-        except Exception as err:
-            result = ""
-            if verbosity >= 1:
-                traceback.print_exception(
-                    type(err), err, err.__traceback__, file=sys.stderr
-                )
-            elif verbosity >= 0:
-                traceback.print_exception(type(err), err, None, file=sys.stderr)
+    convert_all(input_src, args.outfile, verbosity, args.continue_on_err)
 
-            if not args.continue_on_err:
-                if type(err) in {
-                    NotImplementedError,
-                    UnsupportedCensusData,
-                    LowConfidenceTransformation,
-                }:
-                    sys.exit(2)
-                else:
-                    sys.exit(1)
 
-        finally:
-            if result or args.outfile is not sys.stdout:
-                print(result, file=args.outfile)
+if __name__ == "__main__":
+    cli()